@@ -8,16 +8,34 @@ Claude Relay Service 启动工具模块
 
 import os
 import sys
+import asyncio
 import json
+import re
+import hashlib
+import collections
 import time
+import shutil
 import socket
 import platform
+import threading
 import subprocess
+import functools
+import inspect
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Any
+from typing import Callable, Dict, List, Optional, Tuple, Any
+
+_IS_WINDOWS = platform.system() == 'Windows'
+_IS_LINUX = sys.platform.startswith('linux')
+_HAS_PROCFS = _IS_LINUX and os.path.isdir('/proc/self')
+
+# netstat -ano: "TCP  0.0.0.0:3000  0.0.0.0:0  LISTENING  1234"
+_NETSTAT_LISTEN_RE = re.compile(r'^\s*TCP\s+\S+:(\d+)\s+\S+:0\s+\S+\s+(\d+)\s*$', re.MULTILINE)
+# lsof -Fn: "n*:3000" / "n[::1]:6379"
+_LSOF_PORT_RE = re.compile(r':(\d+)$')
 
 # 设置UTF-8编码
-if platform.system() == 'Windows':
+if _IS_WINDOWS:
     import locale
     try:
         sys.stdout.reconfigure(encoding='utf-8')
@@ -40,53 +58,242 @@ class Colors:
     END = '\033[0m'
 
 
+# 输出重定向到文件（如后台运行）或设置了NO_COLOR时不输出ANSI转义序列
+if not (getattr(sys.stdout, 'isatty', None) and sys.stdout.isatty()) or os.environ.get('NO_COLOR'):
+    for _name in ('RED', 'GREEN', 'YELLOW', 'BLUE', 'MAGENTA', 'CYAN',
+                  'WHITE', 'BOLD', 'UNDERLINE', 'END'):
+        setattr(Colors, _name, '')
+    del _name
+
+
 class Logger:
     """简单的日志输出工具"""
 
+    # 非UTF-8终端下emoji前缀的替换表
+    _FALLBACK = {
+        "ℹ️": "[INFO]",
+        "✅": "[OK]",
+        "⚠️": "[WARN]",
+        "❌": "[ERROR]",
+        "🔍": "[DEBUG]",
+        "🚀": ">>",
+    }
+
     @staticmethod
-    def _safe_print(color: str, prefix: str, message: str):
-        """安全的打印函数"""
+    def _utf_emit(color: str, prefix: str, message: str):
+        """UTF-8终端直接输出"""
         print(f"{color}{prefix} {message}{Colors.END}")
 
+    @staticmethod
+    def _ascii_emit(color: str, prefix: str, message: str):
+        """非UTF-8终端：替换emoji前缀，无法编码的字符以?代替"""
+        prefix = Logger._FALLBACK.get(prefix, prefix)
+        encoding = getattr(sys.stdout, 'encoding', None) or 'ascii'
+        text = f"{color}{prefix} {message}{Colors.END}"
+        print(text.encode(encoding, errors='replace').decode(encoding))
+
+    # 在模块加载时根据终端编码选定
+    _emit = _utf_emit
+
     @staticmethod
     def info(message: str, prefix: str = "ℹ️"):
-        Logger._safe_print(Colors.CYAN, prefix, message)
+        Logger._emit(Colors.CYAN, prefix, message)
 
     @staticmethod
     def success(message: str, prefix: str = "✅"):
-        Logger._safe_print(Colors.GREEN, prefix, message)
+        Logger._emit(Colors.GREEN, prefix, message)
 
     @staticmethod
     def warning(message: str, prefix: str = "⚠️"):
-        Logger._safe_print(Colors.YELLOW, prefix, message)
+        Logger._emit(Colors.YELLOW, prefix, message)
 
     @staticmethod
     def error(message: str, prefix: str = "❌"):
-        Logger._safe_print(Colors.RED, prefix, message)
+        Logger._emit(Colors.RED, prefix, message)
 
     @staticmethod
     def debug(message: str, prefix: str = "🔍"):
-        Logger._safe_print(Colors.MAGENTA, prefix, message)
+        Logger._emit(Colors.MAGENTA, prefix, message)
 
     @staticmethod
     def header(message: str):
-        print(f"\n{Colors.BOLD}{Colors.BLUE}🚀 {message}{Colors.END}\n")
+        print()
+        Logger._emit(f"{Colors.BOLD}{Colors.BLUE}", "🚀", message)
+        print()
+
+
+if (getattr(sys.stdout, 'encoding', None) or '').lower().replace('-', '').replace('_', '') not in ('utf8', 'cp65001'):
+    Logger._emit = staticmethod(Logger._ascii_emit)
+
+
+def cached_method(func):
+    """将检查结果缓存到实例的 _cache 中，键为 (方法名, 参数)"""
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        bound = signature.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        key = (func.__name__,) + tuple(bound.arguments.values())[1:]
+        if key not in self._cache:
+            self._cache[key] = func(self, *args, **kwargs)
+        return self._cache[key]
+    return wrapper
 
 
 class SystemChecker:
     """系统环境检查工具"""
 
+    # 批量版本探测的命令表：名称 -> 命令
+    VERSION_COMMANDS = {
+        'node': 'node --version',
+        'npm': 'npm --version',
+        'docker': 'docker --version',
+        'docker_compose': 'docker-compose --version',
+    }
+
+    # 通常一起使用的工具在同一次探测中获取，dev/prod 不会触发 docker 探测
+    VERSION_GROUPS = (('node', 'npm'), ('docker', 'docker_compose'))
+    VERSION_PROBE_TIMEOUT = 10
+
+    # 增量检查：构建项 -> 源文件（相对项目根目录）
+    BUILD_SOURCES = {
+        'dependencies': ['package.json', 'package-lock.json'],
+        'frontend': ['web/admin-spa/package.json'],
+    }
+
     def __init__(self):
         self.logger = Logger()
         self.project_root = Path(__file__).parent.parent
+        self.build_cache_file = self.project_root / '.start_cache.json'
+        self._cache: Dict[Tuple, Any] = {}
+        self._versions: Dict[str, Optional[str]] = {}
+        self._version_errors: Dict[str, str] = {}
+        self._versions_lock = threading.Lock()
+        self._group_locks = {group: threading.Lock() for group in self.VERSION_GROUPS}
+
+    def invalidate(self):
+        """清除缓存的检查结果，下次检查时重新探测"""
+        with self._versions_lock:
+            self._cache.clear()
+            self._versions.clear()
+            self._version_errors.clear()
+
+    def _version_probe_args(self, names: List[str]) -> List[str]:
+        """构造批量版本探测的命令行"""
+        if _IS_WINDOWS:
+            # call 保证 npm.cmd 等批处理执行后继续后续命令
+            script = ' & '.join(
+                f'echo ===BEGIN {name}=== & call {self.VERSION_COMMANDS[name]} 2>nul && echo ===OK==='
+                for name in names
+            )
+            return ['cmd', '/c', script]
+        script = '; '.join(
+            f'echo "===BEGIN {name}==="; {self.VERSION_COMMANDS[name]} 2>/dev/null && echo "===OK==="'
+            for name in names
+        )
+        return ['sh', '-c', script]
 
+    def _parse_versions(self, stdout: str, names: List[str],
+                        finished: bool) -> Dict[str, Optional[str]]:
+        """解析批量版本探测的输出
+
+        只返回已完成探测的工具，未输出 ===OK=== 的视为未安装；
+        finished 为 False（超时）时，最后一个开始探测且未完成的工具结果未知，不包含在内
+        """
+        versions: Dict[str, Optional[str]] = {}
+        started: List[str] = []
+        output: List[str] = []
+        for line in stdout.splitlines():
+            line = line.strip()
+            if line.startswith('===BEGIN ') and line.endswith('==='):
+                started.append(line[len('===BEGIN '):-len('===')])
+                output = []
+            elif line == '===OK===':
+                if started and started[-1] in names:
+                    versions[started[-1]] = '\n'.join(output)
+            elif line and started:
+                output.append(line)
+
+        completed = names if finished else [name for name in started[:-1] if name in names]
+        for name in completed:
+            versions.setdefault(name, None)
+        return versions
+
+    def probe_all_versions(self, names: Optional[List[str]] = None) -> Dict[str, Optional[str]]:
+        """通过一次子进程调用批量获取各工具版本
+
+        返回 名称 -> 版本字符串，未安装或无法执行时为 None；
+        超时前未完成探测的工具不在结果中
+        """
+        names = list(names or self.VERSION_COMMANDS)
+        with subprocess.Popen(self._version_probe_args(names),
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              text=True, errors='replace',
+                              **self._probe_group_kwargs()) as process:
+            try:
+                stdout, _ = process.communicate(timeout=self.VERSION_PROBE_TIMEOUT)
+                finished = True
+            except subprocess.TimeoutExpired:
+                # 卡住的是shell的子进程，它仍持有stdout管道，必须整组终止
+                self._kill_probe_group(process)
+                # 再次communicate不会丢失超时前已读到的输出
+                stdout, _ = process.communicate()
+                finished = False
+        return self._parse_versions(stdout, names, finished)
+
+    @staticmethod
+    def _probe_group_kwargs() -> Dict[str, Any]:
+        """让探测shell及其子进程位于独立的进程组，便于超时时整组终止"""
+        if _IS_WINDOWS:
+            return {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+        return {'start_new_session': True}
+
+    @staticmethod
+    def _kill_probe_group(process):
+        """终止探测shell及其启动的所有工具进程"""
+        try:
+            if _IS_WINDOWS:
+                subprocess.run(['taskkill', '/T', '/F', '/PID', str(process.pid)],
+                             capture_output=True, timeout=10)
+            else:
+                os.killpg(process.pid, 9)  # SIGKILL
+        except (OSError, subprocess.SubprocessError):
+            process.kill()
+
+    def _store_versions(self, names: Tuple[str, ...], versions: Dict[str, Optional[str]]):
+        """保存探测结果，未完成的工具记为超时"""
+        with self._versions_lock:
+            for name in names:
+                if name in versions:
+                    self._versions[name] = versions[name]
+                else:
+                    self._version_errors[name] = f"版本探测超时 ({self.VERSION_PROBE_TIMEOUT}秒)"
+
+    def _store_version_error(self, names: Tuple[str, ...], error: Exception):
+        with self._versions_lock:
+            for name in names:
+                self._version_errors[name] = str(error)
+
+    def _get_version(self, name: str) -> Optional[str]:
+        """读取工具版本，首次调用时探测该工具所在的分组"""
+        group = next(group for group in self.VERSION_GROUPS if name in group)
+        with self._group_locks[group]:
+            if name not in self._versions and name not in self._version_errors:
+                try:
+                    self._store_versions(group, self.probe_all_versions(list(group)))
+                except Exception as e:
+                    self._store_version_error(group, e)
+        if name in self._version_errors:
+            raise RuntimeError(self._version_errors[name])
+        return self._versions.get(name)
+
+    @cached_method
     def check_node_version(self) -> Tuple[bool, str]:
         """检查Node.js版本"""
         try:
-            result = subprocess.run(['node', '--version'],
-                                  capture_output=True, text=True, timeout=10)
-            if result.returncode == 0:
-                version = result.stdout.strip()
+            version = self._get_version('node')
+            if version:
                 # 检查版本是否 >= 18.0.0
                 version_num = version.lstrip('v').split('.')[0]
                 if int(version_num) >= 18:
@@ -97,60 +304,163 @@ class SystemChecker:
         except Exception as e:
             return False, f"检查Node.js失败: {str(e)}"
 
+    @cached_method
     def check_npm_installed(self) -> Tuple[bool, str]:
         """检查npm是否安装"""
         try:
-            result = subprocess.run(['npm', '--version'],
-                                  capture_output=True, text=True, timeout=10)
-            if result.returncode == 0:
-                return True, result.stdout.strip()
+            version = self._get_version('npm')
+            if version:
+                return True, version
             return False, "npm未安装"
         except Exception as e:
             return False, f"检查npm失败: {str(e)}"
 
+    @cached_method
     def check_docker_installed(self) -> Tuple[bool, str]:
         """检查Docker是否安装"""
         try:
-            result = subprocess.run(['docker', '--version'],
-                                  capture_output=True, text=True, timeout=10)
-            if result.returncode == 0:
-                return True, result.stdout.strip()
+            version = self._get_version('docker')
+            if version:
+                return True, version
             return False, "Docker未安装"
         except Exception as e:
             return False, f"检查Docker失败: {str(e)}"
 
+    @cached_method
     def check_docker_compose_installed(self) -> Tuple[bool, str]:
         """检查Docker Compose是否安装"""
         try:
-            result = subprocess.run(['docker-compose', '--version'],
-                                  capture_output=True, text=True, timeout=10)
-            if result.returncode == 0:
-                return True, result.stdout.strip()
+            version = self._get_version('docker_compose')
+            if version:
+                return True, version
             return False, "Docker Compose未安装"
         except Exception as e:
             return False, f"检查Docker Compose失败: {str(e)}"
 
+    def _load_build_cache(self) -> Dict[str, str]:
+        """读取上次成功构建记录的源文件哈希"""
+        try:
+            with open(self.build_cache_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _hash_sources(self, name: str) -> str:
+        """计算构建项对应源文件的内容哈希"""
+        digest = hashlib.sha256()
+        for source in self.BUILD_SOURCES[name]:
+            path = self.project_root / source
+            if path.exists():
+                digest.update(path.read_bytes())
+        return digest.hexdigest()
+
+    def record_build(self, name: str):
+        """记录一次成功的安装/构建，供后续启动跳过"""
+        cache = self._load_build_cache()
+        try:
+            cache[name] = self._hash_sources(name)
+            with open(self.build_cache_file, 'w', encoding='utf-8') as f:
+                json.dump(cache, f, indent=2)
+        except OSError:
+            pass
+
+    def _is_up_to_date(self, name: str, target: Path) -> bool:
+        """类似Make：目标比所有源文件新，或源文件内容与上次成功构建时一致"""
+        if not target.exists():
+            return False
+        try:
+            sources = [self.project_root / source for source in self.BUILD_SOURCES[name]]
+            newest = max((p.stat().st_mtime for p in sources if p.exists()), default=0)
+            if newest <= target.stat().st_mtime:
+                return True
+            # mtime不可靠（如CI重新检出代码）时比较内容哈希
+            return self._load_build_cache().get(name) == self._hash_sources(name)
+        except OSError:
+            return False
+
+    @cached_method
     def check_dependencies_installed(self) -> bool:
-        """检查npm依赖是否已安装"""
+        """检查npm依赖是否已安装且与package.json一致"""
         node_modules = self.project_root / 'node_modules'
         package_lock = self.project_root / 'package-lock.json'
-        return node_modules.exists() and package_lock.exists()
+        if not (node_modules.exists() and package_lock.exists()):
+            return False
+        # npm >= 7 安装完成后会写入 node_modules/.package-lock.json
+        hidden_lock = node_modules / '.package-lock.json'
+        return self._is_up_to_date('dependencies', hidden_lock if hidden_lock.exists() else node_modules)
 
+    @cached_method
     def check_frontend_built(self) -> bool:
-        """检查前端是否已构建"""
+        """检查前端是否已构建且不旧于package.json"""
         frontend_dist = self.project_root / 'web' / 'admin-spa' / 'dist'
-        return frontend_dist.exists() and len(list(frontend_dist.glob('*'))) > 0
+        if not frontend_dist.exists():
+            return False
+        # 只需判断是否非空，取到第一个条目即可
+        with os.scandir(frontend_dist) as entries:
+            if next(entries, None) is None:
+                return False
+        return self._is_up_to_date('frontend', frontend_dist / 'index.html')
 
+    @cached_method
     def check_port_available(self, port: int) -> bool:
         """检查端口是否可用"""
         try:
             with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-                sock.settimeout(1)
-                result = sock.connect_ex(('localhost', port))
-                return result != 0  # 0表示端口被占用
+                # 与服务一样绑定通配地址（config默认 host 0.0.0.0）：
+                # - Linux/macOS：SO_REUSEADDR 与Node行为一致，端口仅剩TIME_WAIT连接
+                #   （如服务刚停止）时不会误报占用；已有通配地址上的监听仍会绑定失败。
+                #   代价：macOS/BSD上只监听某个具体地址（如仅127.0.0.1）的进程检测不到，
+                #   服务默认监听通配地址，接受这一点以避免重启时误报
+                # - Windows：SO_REUSEADDR 允许抢占已监听端口，改用 SO_EXCLUSIVEADDRUSE
+                if _IS_WINDOWS:
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_EXCLUSIVEADDRUSE, 1)
+                else:
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                sock.bind(('0.0.0.0', port))
+                sock.listen(1)
+                return True
+        except OSError:
+            return False  # 绑定失败表示端口被占用
+
+    def check_ports_available(self, ports: List[int]) -> Dict[int, bool]:
+        """并发检查多个端口是否可用"""
+        # 去重：同一端口并发bind会互相干扰（如dev/prod默认都是3000）
+        checks = {port: functools.partial(self.check_port_available, port)
+                  for port in dict.fromkeys(ports)}
+        return self.run_checks_parallel(checks)
+
+    @cached_method
+    def get_port_owners(self) -> Dict[int, int]:
+        """一次性获取所有监听端口及其所属进程 (端口 -> PID)"""
+        owners: Dict[int, int] = {}
+        try:
+            if _IS_WINDOWS:
+                # 不加 -p TCP，否则只列出IPv4，漏掉 [::]/[::1] 上的监听
+                result = subprocess.run(['netstat', '-ano'],
+                                      capture_output=True, text=True, timeout=10)
+                # 远端地址为 *:0 的即监听端口，不依赖本地化的 LISTENING 字样
+                for match in _NETSTAT_LISTEN_RE.finditer(result.stdout):
+                    owners.setdefault(int(match.group(1)), int(match.group(2)))
+            else:
+                result = subprocess.run(['lsof', '-nP', '-iTCP', '-sTCP:LISTEN', '-Fpn'],
+                                      capture_output=True, text=True, timeout=10)
+                pid = None
+                for line in result.stdout.splitlines():
+                    if line.startswith('p'):
+                        pid = int(line[1:])
+                    elif line.startswith('n') and pid is not None:
+                        match = _LSOF_PORT_RE.search(line)
+                        if match:
+                            owners.setdefault(int(match.group(1)), pid)
         except Exception:
-            return True
+            pass
+        return owners
 
+    def get_port_owner(self, port: int) -> Optional[int]:
+        """获取占用指定端口的进程PID"""
+        return self.get_port_owners().get(port)
+
+    @cached_method
     def check_redis_connection(self, host: str = 'localhost', port: int = 6379) -> bool:
         """检查Redis连接"""
         try:
@@ -161,6 +471,92 @@ class SystemChecker:
         except Exception:
             return False
 
+    def get_environment_checks(self, include_docker: bool = False) -> Dict[str, Callable[[], Any]]:
+        """获取环境检查项（名称 -> 检查函数）"""
+        checks = {
+            'node': self.check_node_version,
+            'npm': self.check_npm_installed,
+        }
+        if include_docker:
+            checks['docker'] = self.check_docker_installed
+            checks['docker_compose'] = self.check_docker_compose_installed
+        return checks
+
+    def run_checks_parallel(self, checks: Dict[Any, Callable[[], Any]]) -> Dict[Any, Any]:
+        """并发执行相互独立的检查，返回 名称 -> 检查结果"""
+        results = {}
+        if not checks:
+            return results
+
+        with ThreadPoolExecutor(max_workers=len(checks)) as executor:
+            futures = {executor.submit(fn): name for name, fn in checks.items()}
+            for future in as_completed(futures):
+                # 每个名称只有一个写入者，无需加锁
+                results[futures[future]] = future.result()
+        return results
+
+    async def _async_probe_versions(self, names: List[str]) -> Dict[str, Optional[str]]:
+        """异步执行批量版本探测"""
+        process = await asyncio.create_subprocess_exec(
+            *self._version_probe_args(names),
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL,
+            **self._probe_group_kwargs())
+        lines: List[bytes] = []
+
+        async def read_output():
+            async for line in process.stdout:
+                lines.append(line)
+            await process.wait()
+
+        finished = True
+        try:
+            await asyncio.wait_for(read_output(), self.VERSION_PROBE_TIMEOUT)
+        except asyncio.TimeoutError:
+            # 只kill shell时卡住的工具进程仍持有管道，wait会一直阻塞
+            self._kill_probe_group(process)
+            await process.wait()
+            finished = False
+        return self._parse_versions(b''.join(lines).decode('utf-8', errors='replace'),
+                                    names, finished)
+
+    async def _async_redis_connection(self, host: str, port: int) -> bool:
+        """异步检查Redis连接"""
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), 2)
+            writer.close()
+            return True
+        except (OSError, asyncio.TimeoutError):
+            return False
+
+    async def _async_checks(self, redis_host: str, redis_port: int):
+        """并发执行版本探测与Redis探测，结果写入缓存"""
+        group = ('node', 'npm')
+        versions, redis_ok = await asyncio.gather(
+            self._async_probe_versions(list(group)),
+            self._async_redis_connection(redis_host, redis_port),
+            return_exceptions=True)
+
+        if isinstance(versions, Exception):
+            self._store_version_error(group, versions)
+        else:
+            self._store_versions(group, versions)
+        self._cache[('check_redis_connection', redis_host, redis_port)] = redis_ok is True
+
+    def run_async_checks(self, redis_host: str = 'localhost', redis_port: int = 6379,
+                         port: Optional[int] = None) -> Dict[str, Any]:
+        """使用asyncio并发执行node/npm/Redis/端口检查"""
+        asyncio.run(self._async_checks(redis_host, redis_port))
+
+        # 以下调用均命中缓存；端口为本地bind探测，无需异步
+        results = {
+            'node': self.check_node_version(),
+            'npm': self.check_npm_installed(),
+            'redis': self.check_redis_connection(redis_host, redis_port),
+        }
+        if port is not None:
+            results['port'] = self.check_port_available(port)
+        return results
+
     def get_system_info(self) -> Dict[str, str]:
         """获取系统信息"""
         return {
@@ -182,6 +578,8 @@ class ConfigManager:
         self.config_file = project_root / 'config' / 'config.js'
         self.config_example = project_root / 'config' / 'config.example.js'
         self.start_config_file = project_root / 'config' / 'start_config.json'
+        self._env_cache: Dict[str, str] = {}
+        self._env_mtime: Optional[float] = None
 
     def ensure_env_file(self) -> bool:
         """确保.env文件存在"""
@@ -189,9 +587,7 @@ class ConfigManager:
             env_example = self.project_root / '.env.example'
             if env_example.exists():
                 self.logger.info("复制.env.example到.env")
-                with open(env_example, 'r', encoding='utf-8') as src:
-                    with open(self.env_file, 'w', encoding='utf-8') as dst:
-                        dst.write(src.read())
+                shutil.copyfile(str(env_example), str(self.env_file))
                 return True
             else:
                 self.logger.warning(".env.example文件不存在，无法自动生成.env")
@@ -203,9 +599,7 @@ class ConfigManager:
         if not self.config_file.exists():
             if self.config_example.exists():
                 self.logger.info("复制config.example.js到config.js")
-                with open(self.config_example, 'r', encoding='utf-8') as src:
-                    with open(self.config_file, 'w', encoding='utf-8') as dst:
-                        dst.write(src.read())
+                shutil.copyfile(str(self.config_example), str(self.config_file))
                 return True
             else:
                 self.logger.warning("config.example.js文件不存在，无法自动生成config.js")
@@ -244,28 +638,73 @@ class ConfigManager:
     def save_start_config(self, config: Dict[str, Any]) -> bool:
         """保存启动配置"""
         try:
+            data = json.dumps(config, indent=2, ensure_ascii=False).encode('utf-8')
+
+            # 内容未变化时跳过写入
+            try:
+                if self.start_config_file.read_bytes() == data:
+                    return True
+            except OSError:
+                pass
+
+            # 先写临时文件再替换，避免进程被杀时留下半截配置
             os.makedirs(self.start_config_file.parent, exist_ok=True)
-            with open(self.start_config_file, 'w', encoding='utf-8') as f:
-                json.dump(config, f, indent=2, ensure_ascii=False)
+            tmp_file = self.start_config_file.with_name(self.start_config_file.name + '.tmp')
+            with open(tmp_file, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_file, self.start_config_file)
             return True
         except Exception as e:
             self.logger.error(f"保存启动配置失败: {e}")
             return False
 
-    def get_env_value(self, key: str, default: str = '') -> str:
-        """从.env文件获取值"""
-        if not self.env_file.exists():
-            return default
+    def _load_env(self) -> Dict[str, str]:
+        """解析.env文件为字典，文件未修改时直接返回缓存"""
+        try:
+            mtime = self.env_file.stat().st_mtime
+        except OSError:
+            self._env_cache, self._env_mtime = {}, None
+            return self._env_cache
+
+        if mtime == self._env_mtime:
+            return self._env_cache
 
+        env: Dict[str, str] = {}
         try:
             with open(self.env_file, 'r', encoding='utf-8') as f:
                 for line in f:
                     line = line.strip()
-                    if line.startswith(key + '='):
-                        return line.split('=', 1)[1]
+                    if not line or line.startswith('#'):
+                        continue
+                    key, sep, value = line.partition('=')
+                    if sep:
+                        # 与逐行查找保持一致：重复的键以第一次出现为准
+                        env.setdefault(key, value)
         except Exception:
             pass
-        return default
+
+        self._env_cache, self._env_mtime = env, mtime
+        return env
+
+    def get_env_value(self, key: str, default: str = '') -> str:
+        """从.env文件获取值"""
+        return self._load_env().get(key, default)
+
+
+@functools.lru_cache(maxsize=None)
+def _load_kernel32():
+    """加载kernel32并声明用到的函数签名（仅Windows）"""
+    import ctypes
+    from ctypes import wintypes
+    # use_last_error 让 ctypes 在调用后立即保存错误码，避免被运行时覆盖
+    kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+    kernel32.OpenProcess.argtypes = (wintypes.DWORD, wintypes.BOOL, wintypes.DWORD)
+    kernel32.OpenProcess.restype = wintypes.HANDLE  # 64位句柄，默认c_int会截断
+    kernel32.WaitForSingleObject.argtypes = (wintypes.HANDLE, wintypes.DWORD)
+    kernel32.WaitForSingleObject.restype = wintypes.DWORD
+    kernel32.CloseHandle.argtypes = (wintypes.HANDLE,)
+    kernel32.CloseHandle.restype = wintypes.BOOL
+    return kernel32
 
 
 class ProcessManager:
@@ -276,57 +715,137 @@ class ProcessManager:
         self.logger = Logger()
         self.pid_file = project_root / 'claude-relay-service.pid'
 
+    @staticmethod
+    def _is_process_running_win32(pid: int) -> bool:
+        """通过Win32 API检查进程是否运行，避免启动tasklist"""
+        import ctypes
+        kernel32 = _load_kernel32()
+        handle = kernel32.OpenProcess(0x00100000, False, pid)  # SYNCHRONIZE
+        if not handle:
+            # ERROR_ACCESS_DENIED: 进程存在但属于其他用户
+            return ctypes.get_last_error() == 5
+        try:
+            # WAIT_TIMEOUT 表示进程尚未结束
+            return kernel32.WaitForSingleObject(handle, 0) == 0x102
+        finally:
+            kernel32.CloseHandle(handle)
+
     def is_process_running(self, pid: int) -> bool:
         """检查进程是否运行"""
         try:
-            if platform.system() == 'Windows':
-                result = subprocess.run(['tasklist', '/FI', f'PID eq {pid}'],
-                                      capture_output=True, text=True)
-                return str(pid) in result.stdout
+            if _IS_WINDOWS:
+                try:
+                    return self._is_process_running_win32(pid)
+                except (OSError, AttributeError):
+                    result = subprocess.run(['tasklist', '/FI', f'PID eq {pid}'],
+                                          capture_output=True, text=True)
+                    return str(pid) in result.stdout
+            elif _HAS_PROCFS:
+                # 一次stat即可，且不受其他用户进程的EPERM影响
+                return os.path.exists(f'/proc/{pid}')
             else:
                 os.kill(pid, 0)
                 return True
         except (OSError, subprocess.SubprocessError):
             return False
 
+    def read_pid(self) -> Optional[int]:
+        """读取PID文件，不检查进程状态也不修改文件"""
+        try:
+            with open(self.pid_file, 'r') as f:
+                return int(f.read().strip())
+        except (ValueError, OSError):
+            return None
+
     def get_running_pid(self) -> Optional[int]:
         """获取运行中的进程PID"""
-        if self.pid_file.exists():
-            try:
-                with open(self.pid_file, 'r') as f:
-                    pid = int(f.read().strip())
-                    if self.is_process_running(pid):
-                        return pid
-                    else:
-                        # PID文件存在但进程不运行，删除PID文件
-                        self.pid_file.unlink()
-            except (ValueError, FileNotFoundError):
-                pass
+        pid = self.read_pid()
+        if pid is None:
+            return None
+        if self.is_process_running(pid):
+            return pid
+        # PID文件存在但进程不运行，删除PID文件
+        try:
+            self.pid_file.unlink()
+        except FileNotFoundError:
+            pass
         return None
 
+    def _has_exited(self, pid: int) -> bool:
+        """判断进程是否已退出，子进程优先用waitpid回收"""
+        try:
+            waited_pid, _ = os.waitpid(pid, os.WNOHANG)
+            return waited_pid == pid
+        except ChildProcessError:
+            # 不是当前进程的子进程
+            return not self.is_process_running(pid)
+
+    def _wait_for_exit(self, pid: int, timeout: float) -> bool:
+        """以递增间隔轮询等待进程退出，超时返回False"""
+        deadline = time.monotonic() + timeout
+        for delay in (0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0):
+            if self._has_exited(pid):
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(delay, remaining))
+        return self._has_exited(pid)
+
     def kill_process(self, pid: int) -> bool:
         """终止进程"""
         try:
-            if platform.system() == 'Windows':
+            if _IS_WINDOWS:
                 subprocess.run(['taskkill', '/F', '/PID', str(pid)],
                              capture_output=True)
             else:
                 os.kill(pid, 15)  # SIGTERM
-                time.sleep(2)
-                if self.is_process_running(pid):
+                if not self._wait_for_exit(pid, timeout=2):
                     os.kill(pid, 9)  # SIGKILL
             return True
         except Exception as e:
             self.logger.error(f"终止进程失败: {e}")
             return False
 
+    def run_foreground(self, command: List[str], env: Optional[Dict[str, str]] = None) -> int:
+        """前台运行命令
+
+        非Windows平台用exec直接替换当前进程，成功时不会返回，
+        调用方需在此之前完成所有日志输出；Windows下等待子进程结束并返回退出码。
+        命令无法执行时返回127，当前工作目录保持不变。
+        """
+        env = env if env is not None else os.environ.copy()
+        if not _IS_WINDOWS:
+            for stream in (sys.stdout, sys.stderr):
+                if stream:
+                    stream.flush()
+            original_cwd = os.getcwd()
+            try:
+                os.chdir(self.project_root)
+                os.execvpe(command[0], command, env)
+            except OSError as e:
+                os.chdir(original_cwd)
+                self.logger.error(f"启动进程失败: {e}")
+                return 127
+
+        try:
+            process = subprocess.Popen(command, cwd=self.project_root, env=env)
+        except OSError as e:
+            self.logger.error(f"启动进程失败: {e}")
+            return 127
+        try:
+            return process.wait()
+        except KeyboardInterrupt:
+            # Ctrl+C 已同时发送给子进程，等待其退出
+            return process.wait()
+
     def start_background_process(self, command: List[str],
                                 log_file: Optional[Path] = None) -> Optional[subprocess.Popen]:
         """启动后台进程"""
         try:
             kwargs = {
                 'cwd': self.project_root,
-                'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP if platform.system() == 'Windows' else 0
+                'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP if _IS_WINDOWS else 0
             }
 
             if log_file:
@@ -345,12 +864,71 @@ class ProcessManager:
 class ServiceStarter:
     """服务启动器"""
 
+    # service:{action} 脚本对应的 manage.js 参数（与 package.json 保持一致），
+    # 不在表中的操作仍通过 npm run service:{action} 执行
+    SERVICE_ACTIONS = {
+        'start': ['start'],
+        'stop': ['stop'],
+        'restart': ['restart'],
+        'start:daemon': ['start', '-d'],
+        'start:d': ['start', '-d'],
+        'daemon': ['start', '-d'],
+        'restart:daemon': ['restart', '-d'],
+        'restart:d': ['restart', '-d'],
+        'logs:follow': ['logs', '-f'],
+    }
+
     def __init__(self, project_root: Path):
         self.project_root = project_root
         self.logger = Logger()
         self.system_checker = SystemChecker()
         self.config_manager = ConfigManager(project_root)
         self.process_manager = ProcessManager(project_root)
+        self._preflight_cache: Dict[Tuple[str, int], Dict[str, str]] = {}
+
+    def preflight(self, node_env: str, port: int) -> Tuple[bool, Dict[str, str]]:
+        """执行启动前的完整检查流程，返回 (是否通过, 子进程环境变量)
+
+        同一进程内相同 (node_env, port) 通过后不再重复执行；失败不缓存，重试时重新检查并输出错误
+        """
+        key = (node_env, port)
+        if key not in self._preflight_cache:
+            ok, env = self._run_preflight(node_env, port)
+            if not ok:
+                return False, env
+            self._preflight_cache[key] = env
+        return True, dict(self._preflight_cache[key])
+
+    def _run_preflight(self, node_env: str, port: int) -> Tuple[bool, Dict[str, str]]:
+        env = os.environ.copy()
+        env['NODE_ENV'] = node_env
+        env['PORT'] = str(port)
+
+        node_ok, node_message = self.system_checker.check_node_version()
+        if not node_ok:
+            self.logger.error(node_message)
+            return False, env
+
+        npm_ok, npm_message = self.system_checker.check_npm_installed()
+        if not npm_ok:
+            self.logger.error(npm_message)
+            return False, env
+
+        if not self.prepare_environment():
+            return False, env
+        if not self.install_dependencies():
+            return False, env
+        if not self.build_frontend():
+            return False, env
+
+        # Redis不可用时仅警告，不阻止启动
+        self.check_redis_availability()
+
+        if not self.system_checker.check_port_available(port):
+            self.logger.error(f"端口 {port} 已被占用")
+            return False, env
+
+        return True, env
 
     def prepare_environment(self) -> bool:
         """准备环境"""
@@ -371,6 +949,33 @@ class ServiceStarter:
         self.logger.success("环境准备完成")
         return True
 
+    def _run_streaming(self, command: List[str], cwd: Path,
+                       tail_lines: int = 200) -> Tuple[int, str]:
+        """运行命令并逐行读取输出
+
+        完整输出追加写入 logs/npm.log（可用 tail -f 查看进度），内存中只保留最后若干行用于错误报告；
+        读取被中断（如 Ctrl+C）时终止子进程后再抛出
+        """
+        log_file = self.project_root / 'logs' / 'npm.log'
+        log_file.parent.mkdir(parents=True, exist_ok=True)
+        tail = collections.deque(maxlen=tail_lines)
+        with open(log_file, 'a', encoding='utf-8') as log, \
+                subprocess.Popen(command, cwd=cwd,
+                                 stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                 bufsize=1, text=True, errors='replace') as process:
+            log.write(f"\n$ {' '.join(command)}  (cwd: {cwd})\n")
+            try:
+                for line in process.stdout:
+                    tail.append(line)
+                    log.write(line)
+                    log.flush()
+                returncode = process.wait()
+            except BaseException:
+                process.kill()
+                process.wait()
+                raise
+        return returncode, ''.join(tail)
+
     def install_dependencies(self) -> bool:
         """安装依赖"""
         if self.system_checker.check_dependencies_installed():
@@ -379,14 +984,14 @@ class ServiceStarter:
 
         self.logger.info("安装npm依赖...")
         try:
-            result = subprocess.run(['npm', 'install'],
-                                  cwd=self.project_root,
-                                  capture_output=True, text=True)
-            if result.returncode == 0:
+            returncode, output_tail = self._run_streaming(['npm', 'install'], self.project_root)
+            if returncode == 0:
+                self.system_checker.record_build('dependencies')
+                self.system_checker.invalidate()
                 self.logger.success("依赖安装完成")
                 return True
             else:
-                self.logger.error(f"依赖安装失败: {result.stderr}")
+                self.logger.error(f"依赖安装失败: {output_tail}\n完整日志: logs/npm.log")
                 return False
         except Exception as e:
             self.logger.error(f"依赖安装失败: {e}")
@@ -404,27 +1009,91 @@ class ServiceStarter:
             frontend_path = self.project_root / 'web' / 'admin-spa'
             if not (frontend_path / 'node_modules').exists():
                 self.logger.info("安装前端依赖...")
-                result = subprocess.run(['npm', 'install'],
-                                      cwd=frontend_path,
-                                      capture_output=True, text=True)
-                if result.returncode != 0:
-                    self.logger.error(f"前端依赖安装失败: {result.stderr}")
+                returncode, output_tail = self._run_streaming(['npm', 'install'], frontend_path)
+                if returncode != 0:
+                    self.logger.error(f"前端依赖安装失败: {output_tail}\n完整日志: logs/npm.log")
                     return False
 
             # 构建前端
-            result = subprocess.run(['npm', 'run', 'build'],
-                                  cwd=frontend_path,
-                                  capture_output=True, text=True)
-            if result.returncode == 0:
+            returncode, output_tail = self._run_streaming(['npm', 'run', 'build'], frontend_path)
+            if returncode == 0:
+                self.system_checker.record_build('frontend')
+                self.system_checker.invalidate()
                 self.logger.success("前端构建完成")
                 return True
             else:
-                self.logger.error(f"前端构建失败: {result.stderr}")
+                self.logger.error(f"前端构建失败: {output_tail}\n完整日志: logs/npm.log")
                 return False
         except Exception as e:
             self.logger.error(f"前端构建失败: {e}")
             return False
 
+    @staticmethod
+    def _tail_file(path: Path, lines: int, block_size: int = 8192) -> List[str]:
+        """从文件末尾按块向前读取，返回最后若干行"""
+        if lines <= 0:
+            return []
+        with open(path, 'rb') as f:
+            position = f.seek(0, os.SEEK_END)
+            data = b''
+            # 多读一个换行符，保证最前面的一行是完整的
+            while position > 0 and data.count(b'\n') <= lines:
+                step = min(block_size, position)
+                position -= step
+                f.seek(position)
+                data = f.read(step) + data
+        return data.decode('utf-8', errors='replace').splitlines(keepends=True)[-lines:]
+
+    def manage_service(self, action: str, extra_args: Optional[List[str]] = None) -> bool:
+        """管理后台服务（start/stop/restart/status/logs）"""
+        extra_args = extra_args or []
+
+        # status/logs 只读PID文件和日志文件，直接在当前进程处理
+        if action == 'status':
+            # 与 manage.js status 一致：只读取PID文件，不做清理
+            pid = self.process_manager.read_pid()
+            if pid is None or not self.process_manager.is_process_running(pid):
+                self.logger.error("服务未运行")
+                return False
+            self.logger.success(f"服务正在运行 (PID: {pid})")
+            if not _IS_WINDOWS:
+                result = subprocess.run(['ps', '-p', str(pid), '-o',
+                                         'pid=,ppid=,pcpu=,pmem=,etime=,args='],
+                                        capture_output=True, text=True)
+                if result.returncode == 0 and result.stdout.strip():
+                    print()
+                    self.logger.info("进程信息:", prefix="📊")
+                    print('PID\tPPID\tCPU%\tMEM%\tTIME\t\tCOMMAND')
+                    print(result.stdout.strip())
+            return True
+
+        if action == 'logs':
+            lines = int(extra_args[0]) if extra_args and extra_args[0].isdigit() else 50
+            log_file = self.project_root / 'logs' / 'service.log'
+            try:
+                tail = self._tail_file(log_file, lines)
+            except OSError as e:
+                self.logger.error(f"读取日志失败: {e}")
+                return False
+            self.logger.info(f"最近 {lines} 行日志:\n", prefix="📖")
+            print(''.join(tail))
+            return True
+
+        # 其他操作直接调用 manage.js，省去 npm 的启动开销
+        manage_script = self.project_root / 'scripts' / 'manage.js'
+        manage_args = self.SERVICE_ACTIONS.get(action)
+        if manage_script.exists() and manage_args is not None:
+            command = ['node', str(manage_script)] + manage_args + extra_args
+        else:
+            command = ['npm', 'run', f'service:{action}']
+            if extra_args:
+                command += ['--'] + extra_args
+        try:
+            return subprocess.run(command, cwd=self.project_root).returncode == 0
+        except Exception as e:
+            self.logger.error(f"服务{action}失败: {e}")
+            return False
+
     def check_redis_availability(self) -> bool:
         """检查Redis可用性"""
         redis_host = self.config_manager.get_env_value('REDIS_HOST', 'localhost')